@@ -3,12 +3,13 @@ import pandas as pd
 import json
 import os
 import zipfile
-import io
+import tempfile
+import hashlib
 import textwrap
 import qrcode
 import re
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from github import Github, InputGitTreeElement
 
 # --- CONFIGURATION INITIALE ---
@@ -190,6 +191,45 @@ def wrap_text_pixel(text, font, max_width, draw):
         lines.append(current_line)
     return lines
 
+# --- CHARGEMENT PHOTO ---
+def fit_in_box(width, height, box_w, box_h):
+    img_ratio = width / height
+    box_ratio = box_w / box_h
+    if img_ratio > box_ratio:
+        return box_w, max(1, int(box_w / img_ratio))
+    return max(1, int(box_h * img_ratio)), box_h
+
+def load_photo_for_box(path, box_w, box_h, background="white"):
+    with Image.open(path) as src:
+        # Orientation EXIF : 5 à 8 = rotation de 90°, largeur et hauteur sont inversées
+        orientation = src.getexif().get(0x0112, 1)
+        swapped = orientation in (5, 6, 7, 8)
+        disp_w, disp_h = (src.height, src.width) if swapped else (src.width, src.height)
+        new_w, new_h = fit_in_box(disp_w, disp_h, box_w, box_h)
+
+        # JPEG : décodage DCT réduit (1/2, 1/4, 1/8) au plus près de la taille cible,
+        # sans descendre en dessous, avant le rééchantillonnage final.
+        if src.format == "JPEG" and src.mode in ("RGB", "L", "CMYK", "YCbCr"):
+            draft_size = (new_h, new_w) if swapped else (new_w, new_h)
+            src.draft("RGB", draft_size)
+
+        photo = ImageOps.exif_transpose(src)
+
+    # Modes non RGB : transparence aplatie sur le fond du cartel
+    if photo.mode == "P":
+        photo = photo.convert("RGBA")
+    if photo.mode in ("RGBA", "LA", "PA"):
+        photo = photo.convert("RGBA")
+        flat = Image.new("RGB", photo.size, background)
+        flat.paste(photo, mask=photo.getchannel("A"))
+        photo = flat
+    elif photo.mode != "RGB":
+        photo = photo.convert("RGB")
+
+    if photo.size != (new_w, new_h):
+        photo = photo.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    return photo
+
 # --- GENERATEUR IMAGE OPTIMISÉ ---
 def generate_cartel_image(data):
     img = Image.new('RGB', (A4_WIDTH_PX, A4_HEIGHT_PX), color='white')
@@ -215,21 +255,13 @@ def generate_cartel_image(data):
     # IMAGE
     if data.get('image_path') and os.path.exists(data['image_path']):
         try:
-            pil_img = Image.open(data['image_path'])
             box_x = margin
             box_y = int(30 * MM_TO_PX)
             box_w = mid_x - (2 * margin)
             box_h = int(145 * MM_TO_PX)
             
-            img_ratio = pil_img.width / pil_img.height
-            box_ratio = box_w / box_h
-            if img_ratio > box_ratio:
-                new_w = box_w
-                new_h = int(box_w / img_ratio)
-            else:
-                new_h = box_h
-                new_w = int(box_h * img_ratio)
-            pil_img = pil_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            pil_img = load_photo_for_box(data['image_path'], box_w, box_h)
+            new_w, new_h = pil_img.size
             pos_x = box_x + (box_w - new_w) // 2
             pos_y = box_y + (box_h - new_h) // 2
             img.paste(pil_img, (pos_x, pos_y))
@@ -303,6 +335,146 @@ def generate_cartel_image(data):
     
     return img
 
+# --- EXPORT ZIP ---
+def cartel_filename(item):
+    # Nom sûr pour un système de fichiers (dossier partagé SMB/Windows compris)
+    safe_title = re.sub(r'[^\w.-]+', '_', item['titre']).strip('_.')
+    safe_id = re.sub(r'[^\w.-]+', '_', str(item['id']))
+    return f"Cartel_{safe_title}_{safe_id}.jpg"
+
+ZIP_TMP_PREFIX = "paleo_cartels_"
+# Durée de vie des archives jamais téléchargées (session fermée avant le clic)
+ZIP_TMP_MAX_AGE_S = 3600
+
+def purge_stale_zips():
+    tmp_dir = tempfile.gettempdir()
+    now = datetime.now().timestamp()
+    for name in os.listdir(tmp_dir):
+        path = os.path.join(tmp_dir, name)
+        if name.startswith(ZIP_TMP_PREFIX) and name.endswith(".zip"):
+            try:
+                if now - os.path.getmtime(path) > ZIP_TMP_MAX_AGE_S:
+                    os.remove(path)
+            except OSError:
+                pass
+
+def build_cartels_zip(entries, on_progress=None):
+    # Archive "stored" (les JPEG ne se recompressent pas) écrite en flux dans un fichier
+    # temporaire sur disque : chaque cartel est encodé directement dans l'archive.
+    fd, zip_path = tempfile.mkstemp(prefix=ZIP_TMP_PREFIX, suffix=".zip")
+    try:
+        with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as zf:
+            for i, item in enumerate(entries):
+                img = generate_cartel_image(item)
+                with zf.open(cartel_filename(item), "w", force_zip64=True) as dest:
+                    img.save(dest, format='JPEG', quality=95)
+                img.close()
+                if on_progress:
+                    on_progress((i+1)/len(entries))
+    except BaseException:
+        os.remove(zip_path)
+        raise
+    return zip_path
+
+def read_zip(zip_path):
+    # Appelé par Streamlit au clic seulement : les octets de l'archive ne sont chargés
+    # (et gardés dans le MediaFileManager en mémoire) qu'à partir du téléchargement.
+    def _read():
+        with open(zip_path, "rb") as f:
+            return f.read()
+    return _read
+
+# --- EXPORT INCRÉMENTAL (DOSSIER D'IMPRESSION) ---
+EXPORT_MANIFEST = "cartels_manifest.json"
+# À incrémenter quand la mise en page de generate_cartel_image change (force un rendu complet)
+RENDER_VERSION = 1
+
+def cartel_content_hash(item):
+    h = hashlib.sha256()
+    h.update(f"v{RENDER_VERSION}".encode())
+    h.update(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    img_path = item.get('image_path')
+    if img_path and os.path.exists(img_path):
+        # Taille + date de modification : évite de relire chaque photo à chaque export
+        stat = os.stat(img_path)
+        h.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def load_export_manifest(manifest_path):
+    # Le manifeste vit dans un dossier partagé : on ne garde que les entrées bien formées
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError:
+            return {}
+    if not isinstance(raw, dict):
+        return {}
+    return {
+        entry_id: value for entry_id, value in raw.items()
+        if isinstance(value, dict) and isinstance(value.get('hash'), str) and isinstance(value.get('file'), str)
+    }
+
+def remove_export_file(target_dir, fname):
+    # Uniquement un nom de fichier simple, jamais un chemin sortant du dossier cible
+    if not fname or os.path.basename(fname) != fname or fname in ('.', '..'):
+        return False
+    path = os.path.join(target_dir, fname)
+    if not os.path.isfile(path):
+        return False
+    os.remove(path)
+    return True
+
+def export_to_folder(entries, target_dir, on_progress=None):
+    os.makedirs(target_dir, exist_ok=True)
+    manifest_path = os.path.join(target_dir, EXPORT_MANIFEST)
+    old_manifest = load_export_manifest(manifest_path)
+
+    report = {"ajoutés": [], "modifiés": [], "supprimés": [], "inchangés": [], "erreurs": []}
+    new_manifest = {}
+    for i, item in enumerate(entries):
+        content_hash = cartel_content_hash(item)
+        fname = cartel_filename(item)
+        out_path = os.path.join(target_dir, fname)
+        previous = old_manifest.get(item['id'])
+
+        if previous and previous['hash'] == content_hash and previous['file'] == fname and os.path.exists(out_path):
+            report["inchangés"].append(fname)
+            new_manifest[item['id']] = {"hash": content_hash, "file": fname}
+        else:
+            tmp_path = out_path + ".tmp"
+            try:
+                img = generate_cartel_image(item)
+                img.save(tmp_path, format='JPEG', quality=95)
+                img.close()
+                os.replace(tmp_path, out_path)
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                report["erreurs"].append(f"{fname} ({e})")
+                # L'ancien rendu reste en place et sera retenté au prochain export
+                if previous:
+                    new_manifest[item['id']] = previous
+            else:
+                if previous and previous['file'] != fname:
+                    remove_export_file(target_dir, previous['file'])
+                report["modifiés" if previous else "ajoutés"].append(fname)
+                new_manifest[item['id']] = {"hash": content_hash, "file": fname}
+        if on_progress:
+            on_progress((i+1)/len(entries))
+
+    for entry_id, previous in old_manifest.items():
+        if entry_id not in new_manifest:
+            if remove_export_file(target_dir, previous['file']):
+                report["supprimés"].append(previous['file'])
+
+    tmp_manifest = manifest_path + ".tmp"
+    with open(tmp_manifest, 'w') as f:
+        json.dump(new_manifest, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_manifest, manifest_path)
+    return report
+
 # --- PREVIEW HTML ---
 def afficher_cartel_visuel(data, is_draft=False):
     c1, c2 = st.columns([1, 1])
@@ -338,6 +510,8 @@ def afficher_cartel_visuel(data, is_draft=False):
 """, unsafe_allow_html=True)
 
 # --- INIT DATA ---
+# À chaque rerun, quelle que soit la page : les archives ZIP abandonnées ne s'accumulent pas
+purge_stale_zips()
 full_data = load_json(DATA_FILE)
 drafts_data = load_json(DRAFTS_FILE)
 
@@ -465,6 +639,27 @@ if selected_page == "📚 BIBLIOTHÈQUE":
     if 'editing_id' not in st.session_state: st.session_state.editing_id = None
     if 'confirm_bulk_del' not in st.session_state: st.session_state.confirm_bulk_del = False
 
+    # Hors du test de bibliothèque vide : la synchro doit pouvoir vider le dossier d'impression
+    with st.expander("🖨️ Export vers le dossier d'impression", expanded=False):
+        st.caption("Seuls les cartels nouveaux ou modifiés sont régénérés ; les fichiers des cartels supprimés sont retirés.")
+        export_dir = st.text_input("Dossier cible", value="export_impression", key="export_dir")
+        if st.button("SYNCHRONISER LE DOSSIER", key="btn_export_dir"):
+            if not export_dir:
+                st.error("Dossier cible manquant.")
+            else:
+                prog_dir = st.progress(0)
+                with st.spinner("Export en cours..."):
+                    report = export_to_folder(full_data, export_dir, on_progress=prog_dir.progress)
+                st.success(
+                    f"{len(report['ajoutés'])} ajoutés | {len(report['modifiés'])} modifiés | "
+                    f"{len(report['supprimés'])} supprimés | {len(report['inchangés'])} inchangés"
+                )
+                if report['erreurs']:
+                    st.error(f"{len(report['erreurs'])} cartel(s) en erreur : " + ", ".join(report['erreurs']))
+                for label in ("ajoutés", "modifiés", "supprimés"):
+                    if report[label]:
+                        st.caption(f"{label.capitalize()} : " + ", ".join(report[label]))
+
     if not full_data:
         st.info("La bibliothèque est vide.")
     else:
@@ -502,17 +697,17 @@ if selected_page == "📚 BIBLIOTHÈQUE":
                     st.error("Sélection vide.")
                 else:
                     final_selection = [d for d in full_data if d['id'] in st.session_state.selection_active]
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w") as zf:
-                        prog = st.progress(0)
-                        for i, item in enumerate(final_selection):
-                            img = generate_cartel_image(item)
-                            buf = io.BytesIO()
-                            img.save(buf, format='JPEG', quality=95)
-                            fname = f"Cartel_{item['titre'].replace(' ','_')}_{item['id']}.jpg"
-                            zf.writestr(fname, buf.getvalue())
-                            prog.progress((i+1)/len(final_selection))
-                    st.download_button("⬇️ TÉLÉCHARGER", zip_buffer.getvalue(), "Cartels.zip", "application/zip", type="primary")
+                    previous_zip = st.session_state.get('zip_export_path')
+                    if previous_zip and os.path.exists(previous_zip):
+                        os.remove(previous_zip)
+                    purge_stale_zips()
+                    prog = st.progress(0)
+                    zip_path = build_cartels_zip(final_selection, on_progress=prog.progress)
+                    st.session_state.zip_export_path = zip_path
+                    # Pas de rerun au clic : l'archive reste sur disque jusqu'au prochain export
+                    # (ou la purge des archives de plus d'une heure). Limite Streamlit : au clic,
+                    # l'archive entière est copiée dans le stockage média en mémoire du serveur.
+                    st.download_button("⬇️ TÉLÉCHARGER", read_zip(zip_path), "Cartels.zip", "application/zip", type="primary", on_click="ignore")
 
         with col_del_bulk:
             if count_sel > 0:
@@ -0,0 +1,497 @@
+"""Banc de charge headless pour Paleo Maker.
+
+Simule N sessions Streamlit simultanées (via ``streamlit.testing.v1.AppTest``)
+qui parcourent la BIBLIOTHÈQUE, filtrent, cochent des cartels, en modifient un
+et génèrent le ZIP, sur une base synthétique. GitHub est remplacé par un dépôt
+local factice. Le rapport donne les percentiles de latence de rerun par
+interaction, le débit et la mémoire.
+
+AppTest modifie de l'état global de Streamlit (runtime, secrets) à chaque run :
+chaque session tourne donc dans son propre processus, et les résultats sont
+fusionnés à la fin. La base JSON et les photos restent partagées sur disque,
+comme sur un vrai serveur.
+
+Biais principal : un vrai serveur ``streamlit run`` exécute toutes les sessions
+comme des threads d'un seul processus, en concurrence pour le même GIL. Pour
+s'en rapprocher, tous les processus sont épinglés sur un seul cœur partagé
+(``os.sched_setaffinity``, Linux uniquement). Le partage du temps CPU par l'OS
+reste plus favorable que le GIL : les latences mesurées sont une borne basse
+optimiste de celles d'une instance réelle, et le débit une borne haute.
+
+Intégrité : les sessions écrivent toutes dans le même ``db_cartels.json``. Le
+nombre de cartels en fin de run est comparé à celui de départ, et les reruns
+qui affichent « La bibliothèque est vide. » sont comptés, pour qu'une base
+vidée par une écriture concurrente ne fausse pas les latences sans le dire.
+
+Limite des mesures mémoire : AppTest recrée un stockage média en mémoire à
+chaque rerun, les fichiers servis par ``st.image`` et ``st.download_button``
+ne s'accumulent donc pas comme sur un vrai serveur. La taille des archives ZIP
+produites est rapportée à part pour estimer ce coût. Le coût de création de la
+base synthétique est lui aussi rapporté séparément.
+
+    python load_test.py --sessions 8 --entries 200 --rounds 3
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import multiprocessing
+from collections import defaultdict
+
+from PIL import Image, ImageDraw
+from streamlit.testing.v1 import AppTest
+
+import github
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+FONTS = ["PTSansNarrow-Bold.ttf", "PTSansNarrow-Regular.ttf", "PTSerif-Bold.ttf", "PTSerif-Regular.ttf"]
+CATEGORIES = ["Énergie", "H2O", "Mobilité", "Alimentation", "Solaire", "Eolien"]
+EMPTY_LIBRARY_MSG = "La bibliothèque est vide."
+# Délai max pour que toutes les sessions soient prêtes (import, AppTest) avant de démarrer
+SETUP_TIMEOUT_S = 120
+WORDS = ["moulin", "roue", "pompe", "vent", "eau", "soleil", "four", "canal", "voile", "noria", "bélier", "tour"]
+
+
+# --- GITHUB LOCAL (STUB) ---
+class LocalContents:
+    def __init__(self, path, sha):
+        self.path = path
+        self.sha = sha
+
+
+class LocalRepo:
+    """Imite l'API PyGithub utilisée par push_to_github, en écrivant dans un dossier local."""
+
+    def __init__(self, root, latency):
+        self.root = root
+        self.latency = latency
+        self.commits = 0
+
+    def _write(self, path, content):
+        time.sleep(self.latency)
+        dest = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(dest) or self.root, exist_ok=True)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        with open(dest, "wb") as f:
+            f.write(content)
+        self.commits += 1
+
+    def get_contents(self, path):
+        time.sleep(self.latency)
+        dest = os.path.join(self.root, path)
+        if not os.path.exists(dest):
+            raise FileNotFoundError(path)
+        return LocalContents(path, str(os.stat(dest).st_mtime_ns))
+
+    def update_file(self, path, message, content, sha):
+        self._write(path, content)
+
+    def create_file(self, path, message, content):
+        self._write(path, content)
+
+
+def install_github_stub(root, latency):
+    repo = LocalRepo(root, latency)
+
+    class LocalGithub:
+        def __init__(self, token):
+            pass
+
+        def get_repo(self, name):
+            return repo
+
+    # app.py fait "from github import Github" à chaque rerun : le patch du module suffit
+    # (propre au processus de la session)
+    github.Github = LocalGithub
+    return repo
+
+
+# --- BASE SYNTHÉTIQUE ---
+def make_photo(path, size, seed):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(size[0] // 3), y0 + rng.randrange(size[1] // 3)
+        draw.rectangle([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(3)))
+    img.save(path, format="JPEG", quality=90)
+
+
+def build_synthetic_workdir(workdir, entries, photos, photo_size, seed):
+    rng = random.Random(seed)
+    for font in FONTS:
+        src = os.path.join(os.path.dirname(APP_PATH), font)
+        if os.path.exists(src):
+            shutil.copy(src, workdir)
+
+    img_folder = os.path.join(workdir, "images_archive")
+    os.makedirs(img_folder, exist_ok=True)
+    photo_paths = []
+    for i in range(photos):
+        rel = os.path.join("images_archive", f"synth_{i}.jpg")
+        make_photo(os.path.join(workdir, rel), photo_size, seed + i)
+        photo_paths.append(rel)
+
+    data = []
+    for i in range(entries):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).upper()
+        description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 200))).capitalize() + "."
+        data.append({
+            "id": f"synth{i:06d}",
+            "titre": title,
+            "annee": str(rng.randint(-3000, 1900)),
+            "description": description[:1500],
+            "exhume_par": "Banc de charge",
+            "categories": rng.sample(CATEGORIES, rng.randint(1, 3)),
+            "image_path": rng.choice(photo_paths) if photo_paths else None,
+            "date_ajout": "2026-01-01",
+            "url_qr": "https://example.org" if rng.random() < 0.3 else "",
+        })
+    with open(os.path.join(workdir, "db_cartels.json"), "w") as f:
+        json.dump(data, f, indent=4)
+    with open(os.path.join(workdir, "db_drafts.json"), "w") as f:
+        json.dump([], f)
+    return data
+
+
+# --- MESURES ---
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets ailleurs
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    # Rang le plus proche
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+class SessionAborted(Exception):
+    pass
+
+
+class Recorder:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.timeouts = defaultdict(int)
+        self.empty_pages = defaultdict(int)
+
+    def step(self, at, name, prepare=None):
+        """Prépare l'interaction (recherche des widgets), puis mesure le rerun.
+
+        Toute exception (widget introuvable, timeout d'AppTest) est comptée comme
+        erreur de l'interaction et termine proprement la session.
+        """
+        if prepare is not None:
+            try:
+                prepare()
+            except Exception as e:
+                self.errors[name] += 1
+                raise SessionAborted(f"{name} : {e!r}") from e
+        start = time.perf_counter()
+        try:
+            at.run(timeout=self.timeout)
+        except Exception as e:
+            self.latencies[name].append(time.perf_counter() - start)
+            self.errors[name] += 1
+            if "timed out" in str(e):
+                self.timeouts[name] += 1
+            raise SessionAborted(f"{name} : {e!r}") from e
+        self.latencies[name].append(time.perf_counter() - start)
+        if at.exception:
+            self.errors[name] += 1
+        if any(info.value == EMPTY_LIBRARY_MSG for info in at.info):
+            self.empty_pages[name] += 1
+        return at
+
+
+# --- SCÉNARIO D'UNE SESSION ---
+def find_button(at, prefix):
+    button = next((b for b in at.button if b.label.startswith(prefix)), None)
+    if button is None:
+        raise LookupError(f"bouton '{prefix}' introuvable")
+    return button
+
+
+def run_scenario(at, session_idx, args, recorder, rng, zip_sizes):
+    recorder.step(at, "chargement")
+    for _ in range(args.rounds):
+        # Filtre par catégorie
+        recorder.step(at, "filtre", lambda: at.multiselect(key="biblio_filter").set_value(rng.sample(CATEGORIES, 1)))
+
+        # Cases à cocher des cartels visibles
+        boxes = [c for c in at.checkbox if c.key and c.key.startswith("chk_")]
+        for box in rng.sample(boxes, min(args.toggles, len(boxes))):
+            recorder.step(at, "sélection", lambda: at.checkbox(key=box.key).set_value(not box.value))
+
+        # Édition d'un cartel visible
+        edit_buttons = [b for b in at.button if b.key and b.key.startswith("btn_edit_")]
+        if edit_buttons:
+            edit_key = rng.choice(edit_buttons).key
+            recorder.step(at, "ouvrir édition", lambda: at.button(key=edit_key).click())
+
+            def fill_and_save():
+                title_input = next((t for t in at.text_input if t.label == "Titre"), None)
+                if title_input is None:
+                    raise LookupError("champ 'Titre' introuvable")
+                title_input.set_value(f"{title_input.value} S{session_idx}"[:200])
+                find_button(at, "💾 SAUVEGARDER").click()
+            recorder.step(at, "sauvegarde", fill_and_save)
+
+        # Export ZIP de la sélection courante
+        if args.export:
+            recorder.step(at, "export zip", lambda: find_button(at, "📥 GÉNÉRER ZIP").click())
+            zip_path = at.session_state["zip_export_path"] if "zip_export_path" in at.session_state else None
+            if zip_path and os.path.exists(zip_path):
+                zip_sizes.append(os.path.getsize(zip_path) / 1024 / 1024)
+
+        recorder.step(at, "retrait filtre", lambda: at.multiselect(key="biblio_filter").set_value([]))
+
+
+def session_result(session_idx, recorder, aborted, **extra):
+    result = {
+        "session": session_idx,
+        "latencies": dict(recorder.latencies),
+        "errors": dict(recorder.errors),
+        "timeouts": dict(recorder.timeouts),
+        "empty_pages": sum(recorder.empty_pages.values()),
+        "aborted": aborted,
+        "ran": False,
+        "zip_mb": [],
+        "commits": 0,
+    }
+    result.update(extra)
+    return result
+
+
+def session_worker(session_idx, args, workdir, cpu, barrier, results):
+    """Point d'entrée d'un processus : une session AppTest, un stub GitHub local."""
+    recorder = Recorder(args.timeout)
+    try:
+        if cpu is not None:
+            os.sched_setaffinity(0, {cpu})
+        os.chdir(workdir)
+        repo = install_github_stub(os.path.join(workdir, "github_stub", f"session_{session_idx}"), args.github_latency)
+        rng = random.Random(args.seed * 1000 + session_idx)
+        at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+        at.secrets["GITHUB_TOKEN"] = "local-stub"
+        at.secrets["GITHUB_REPO"] = "local/stub"
+        rss_start = current_rss_mb()
+    except Exception as e:
+        # Débloque tout de suite les autres sessions au lieu de les laisser attendre
+        barrier.abort()
+        results.put(session_result(session_idx, recorder, f"préparation : {e!r}"))
+        return
+
+    try:
+        barrier.wait(timeout=args.setup_timeout)
+    except threading.BrokenBarrierError:
+        results.put(session_result(session_idx, recorder, "barrière rompue : une autre session n'a pas démarré"))
+        return
+
+    started = time.time()
+    zip_sizes = []
+    aborted = None
+    try:
+        run_scenario(at, session_idx, args, recorder, rng, zip_sizes)
+    except SessionAborted as e:
+        aborted = str(e)
+    finally:
+        zip_path = at.session_state["zip_export_path"] if "zip_export_path" in at.session_state else None
+        if zip_path and os.path.exists(zip_path):
+            os.remove(zip_path)
+    results.put(session_result(
+        session_idx, recorder, aborted,
+        ran=True,
+        started=started,
+        ended=time.time(),
+        rss_start_mb=rss_start,
+        rss_peak_mb=peak_rss_mb(),
+        zip_mb=zip_sizes,
+        commits=repo.commits,
+    ))
+
+
+def shared_cpu():
+    # Un seul cœur pour toutes les sessions, comme le GIL d'un serveur unique
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return min(os.sched_getaffinity(0))
+
+
+def run_sessions(args, workdir, cpu):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(args.sessions)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=session_worker, args=(i, args, workdir, cpu, barrier, results)) for i in range(args.sessions)]
+    for p in procs:
+        p.start()
+
+    collected = []
+    deadline = time.time() + args.setup_timeout + args.timeout * (args.rounds * (args.toggles + 5) + 1)
+    while len(collected) < len(procs):
+        try:
+            collected.append(results.get(timeout=1))
+        except queue.Empty:
+            if time.time() > deadline or not any(p.is_alive() for p in procs):
+                break
+    for p in procs:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+    # Un processus mort sans résultat (crash, OOM) compte comme session perdue
+    done = {r["session"] for r in collected}
+    crashed = [i for i in range(args.sessions) if i not in done]
+    return collected, crashed
+
+
+def count_entries(workdir):
+    try:
+        with open(os.path.join(workdir, "db_cartels.json")) as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return len(data) if isinstance(data, list) else None
+
+
+# --- RAPPORT ---
+def print_report(results, crashed, setup, final_entries, cpu, args):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    timeouts = defaultdict(int)
+    for r in results:
+        for name, values in r["latencies"].items():
+            latencies[name].extend(values)
+        for name, n in r["errors"].items():
+            errors[name] += n
+        for name, n in r["timeouts"].items():
+            timeouts[name] += n
+    total = sum(len(v) for v in latencies.values())
+    ran = [r for r in results if r["ran"]]
+    wall_time = (max(r["ended"] for r in ran) - min(r["started"] for r in ran)) if ran else 0.0
+
+    print()
+    print(f"Sessions : {args.sessions} | Cartels : {args.entries} | Tours : {args.rounds}")
+    cpu_note = f"toutes épinglées sur le cœur {cpu}" if cpu is not None else "non épinglées (sched_setaffinity indisponible)"
+    print(f"CPU : {os.cpu_count()} cœurs sur la machine, sessions {cpu_note}")
+    print("Latences = borne basse optimiste : un vrai serveur partage un seul GIL entre les sessions.")
+    print(f"{'Interaction':<16}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'erreurs':>9}{'timeouts':>10}")
+    rows = {}
+    for name, values in latencies.items():
+        values = sorted(values)
+        row = {
+            "n": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "erreurs": errors.get(name, 0),
+            "timeouts": timeouts.get(name, 0),
+        }
+        rows[name] = row
+        print(f"{name:<16}{row['n']:>6}{row['p50_ms']:>10.0f}{row['p90_ms']:>10.0f}"
+              f"{row['p99_ms']:>10.0f}{row['max_ms']:>10.0f}{row['erreurs']:>9}{row['timeouts']:>10}")
+
+    increments = sorted(r["rss_peak_mb"] - r["rss_start_mb"] for r in ran)
+    empty_pages = {r["session"]: r["empty_pages"] for r in results if r["empty_pages"]}
+    zip_sizes = [size for r in results for size in r["zip_mb"]]
+    summary = {
+        "interactions": rows,
+        "total_reruns": total,
+        "duree_s": wall_time,
+        "debit_reruns_s": total / wall_time if wall_time else float("nan"),
+        "sessions_interrompues": {r["session"]: r["aborted"] for r in results if r["aborted"]},
+        "sessions_perdues": crashed,
+        "cpu_machine": os.cpu_count(),
+        "cpu_epingle": cpu,
+        "cartels_attendus": args.entries,
+        "cartels_en_fin": final_entries,
+        "pages_vides_par_session": empty_pages,
+        "rss_preparation_mb": setup["rss_after"] - setup["rss_before"],
+        "rss_session_depart_mb": percentile(sorted(r["rss_start_mb"] for r in ran), 50),
+        "rss_session_hausse_p50_mb": percentile(increments, 50),
+        "rss_session_hausse_max_mb": increments[-1] if increments else float("nan"),
+        "rss_sessions_hausse_totale_mb": sum(increments),
+        "zip_max_mb": max(zip_sizes) if zip_sizes else 0.0,
+        "commits_github_stub": sum(r["commits"] for r in results),
+    }
+    print(f"Débit : {summary['debit_reruns_s']:.1f} reruns/s ({total} reruns en {wall_time:.1f} s)")
+    print(f"Préparation de la base synthétique : +{summary['rss_preparation_mb']:.0f} Mo (processus principal, hors mesures)")
+    print(f"Mémoire par session : départ {summary['rss_session_depart_mb']:.0f} Mo | hausse p50 "
+          f"{summary['rss_session_hausse_p50_mb']:.0f} Mo | max {summary['rss_session_hausse_max_mb']:.0f} Mo | "
+          f"total {summary['rss_sessions_hausse_totale_mb']:.0f} Mo")
+    print(f"Archive ZIP max : {summary['zip_max_mb']:.1f} Mo (non gardée en mémoire par AppTest, à ajouter par session sur un vrai serveur)")
+    print(f"Commits GitHub (stub) : {summary['commits_github_stub']}")
+    for idx, reason in summary["sessions_interrompues"].items():
+        print(f"Session {idx} interrompue : {reason}")
+    if crashed:
+        print(f"Sessions sans résultat (processus mort) : {crashed}")
+    if final_entries != args.entries:
+        found = "illisible" if final_entries is None else f"{final_entries} cartels"
+        print(f"ATTENTION base corrompue : {args.entries} cartels au départ, {found} en fin de run "
+              "(écritures concurrentes de db_cartels.json). Latences faussées.")
+    if empty_pages:
+        print(f"ATTENTION pages « {EMPTY_LIBRARY_MSG} » affichées (session : reruns) : {empty_pages}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge headless de Paleo Maker (sessions Streamlit simultanées).")
+    parser.add_argument("--sessions", type=int, default=4, help="Nombre de sessions simultanées (un processus chacune)")
+    parser.add_argument("--entries", type=int, default=100, help="Nombre de cartels synthétiques")
+    parser.add_argument("--photos", type=int, default=8, help="Nombre de photos synthétiques partagées entre cartels")
+    parser.add_argument("--photo-size", type=int, nargs=2, default=[4000, 3000], metavar=("W", "H"))
+    parser.add_argument("--rounds", type=int, default=2, help="Nombre de parcours par session")
+    parser.add_argument("--toggles", type=int, default=3, help="Cases cochées/décochées par parcours")
+    parser.add_argument("--no-export", dest="export", action="store_false", help="Ne pas générer de ZIP")
+    parser.add_argument("--github-latency", type=float, default=0.0, help="Latence simulée (s) par appel GitHub")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout (s) d'un rerun")
+    parser.add_argument("--setup-timeout", type=float, default=SETUP_TIMEOUT_S, help="Délai max (s) de démarrage des sessions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Dossier de travail (temporaire par défaut, conservé si fourni)")
+    parser.add_argument("--json", dest="json_out", help="Écrit le rapport JSON dans ce fichier")
+    args = parser.parse_args(argv)
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="paleo_load_"))
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        setup = {"rss_before": current_rss_mb()}
+        build_synthetic_workdir(workdir, args.entries, args.photos, tuple(args.photo_size), args.seed)
+        setup["rss_after"] = current_rss_mb()
+
+        cpu = shared_cpu()
+        results, crashed = run_sessions(args, workdir, cpu)
+        summary = print_report(results, crashed, setup, count_entries(workdir), cpu, args)
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump(summary, f, indent=4, ensure_ascii=False)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()